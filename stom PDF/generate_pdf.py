@@ -1,18 +1,25 @@
 from __future__ import annotations
 
+import argparse
+import codecs
 import csv
+import hashlib
+import io
 import json
 import os
 import re
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from html import escape
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
 
 
 ROOT_DIR = Path(__file__).resolve().parent
@@ -78,20 +85,82 @@ def _choose_from_list(prompt: str, items: Sequence[str]) -> str:
         return items[idx - 1]
 
 
+_SELECTION_RE = re.compile(r"(?:\d+(?:-\d+)?|all)(?:,(?:\d+(?:-\d+)?|all))*", re.IGNORECASE)
+
+
+def _parse_selection(raw: str, count: int) -> Optional[List[int]]:
+    """
+    Parses "1,3,5-7" (or "all") into 0-based indices (order kept, duplicates
+    dropped). Returns None if the input is malformed or out of range 1..count.
+    """
+    raw = raw.replace(" ", "")
+    if not _SELECTION_RE.fullmatch(raw):
+        return None
+    out: List[int] = []
+    seen: set[int] = set()
+    for chunk in raw.split(","):
+        if chunk.lower() == "all":
+            lo, hi = 1, count
+        else:
+            lo_s, _, hi_s = chunk.partition("-")
+            lo = int(lo_s)
+            hi = int(hi_s) if hi_s else lo
+            if not (1 <= lo <= hi <= count):
+                return None
+        for n in range(lo, hi + 1):
+            if n not in seen:
+                seen.add(n)
+                out.append(n - 1)
+    return out
+
+
+def _select_invoice_ids(raw: str, invoice_ids: Sequence[str]) -> List[str]:
+    """
+    Non-interactive selection by exact invoice ids ("INV-001,INV-007") or "all".
+    List positions are deliberately not accepted here (see --select): with
+    numeric ids "2" could mean either, and the list is never shown to a script.
+    """
+    if raw.strip().lower() == "all":
+        return list(invoice_ids)
+    known = set(invoice_ids)
+    chunks = [c.strip() for c in raw.split(",") if c.strip()]
+    unknown = [c for c in chunks if c not in known]
+    if unknown or not chunks:
+        raise ValueError(f"Неизвестные invoice id: {', '.join(unknown) or raw}")
+    # dict keeps the first occurrence order
+    return list(dict.fromkeys(chunks))
+
+
+def _choose_many_from_list(prompt: str, items: Sequence[str]) -> List[str]:
+    if not items:
+        raise ValueError("Список пуст")
+
+    while True:
+        print()
+        for i, item in enumerate(items, start=1):
+            print(f"{i:>2}. {item}")
+        raw = input(f"\n{prompt} (например: 1,3,5-7 или all): ").strip()
+        indices = _parse_selection(raw, len(items))
+        if not indices:
+            print(f"Введите номера через запятую или диапазоны в пределах 1-{len(items)}.")
+            continue
+        return [items[i] for i in indices]
+
+
 def _list_files_sorted(dir_path: Path, exts: set[str]) -> List[Path]:
     if not dir_path.exists():
         return []
-    files: List[Path] = []
-    for p in dir_path.iterdir():
-        if p.is_file() and p.suffix.lower() in exts:
-            files.append(p)
+    # scandir's DirEntry.is_file() reuses the directory listing's type info
+    # instead of a stat() per entry like Path.is_file()
+    with os.scandir(dir_path) as it:
+        files = [
+            Path(e.path)
+            for e in it
+            if os.path.splitext(e.name)[1].lower() in exts and e.is_file()
+        ]
     return sorted(files, key=lambda x: x.name.lower())
 
 
-def _read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8")
-
-
 def _try_import_pandas():
     try:
         import pandas as pd  # type: ignore
@@ -101,21 +170,187 @@ def _try_import_pandas():
         return None
 
 
+def _try_import_pyarrow_csv():
+    try:
+        from pyarrow import csv as pa_csv  # type: ignore
+
+        return pa_csv
+    except Exception:
+        return None
+
+
+def _try_import_charset_normalizer():
+    try:
+        import charset_normalizer  # type: ignore
+
+        return charset_normalizer
+    except Exception:
+        return None
+
+
+# Non-UTF-8 exports we actually meet (Excel/1C on Windows, DOS, old Unix).
+# Unrestricted detection happily reads a short cp1251 sample as big5/shift_jis.
+_LEGACY_CSV_ENCODINGS = ["cp1251", "cp866", "koi8_r", "mac_cyrillic", "cp1252"]
+
+
+def _guess_legacy_encoding(sample: bytes) -> str:
+    """
+    Encoding of a non-UTF-8 sample: charset-normalizer if available
+    (often installed along with requests), otherwise cp1251.
+    """
+    cn = _try_import_charset_normalizer()
+    if cn is not None:
+        best = cn.from_bytes(sample, cp_isolation=_LEGACY_CSV_ENCODINGS).best()
+        if best is not None:
+            return best.encoding
+    return "cp1251"
+
+
+_CSV_SAMPLE_SIZE = 64 * 1024
+# below this size csv.DictReader beats the import cost of pyarrow/pandas
+_CSV_NATIVE_MIN_SIZE = 200 * 1024
+_CSV_DELIMITERS = ",;\t|"
+# csv.Sniffer's regexes can backtrack badly; it only ever sees this much text
+_CSV_SNIFF_MAX_CHARS = 4096
+
+
+@dataclass(frozen=True)
+class CsvFormat:
+    encoding: str
+    delimiter: str
+    columns: Tuple[str, ...]
+
+
+def _decode_sample(sample: bytes, encoding: str, errors: str = "strict") -> str:
+    # final=False: a multi-byte char cut at the sample edge is not an error
+    return codecs.getincrementaldecoder(encoding)(errors).decode(sample, final=False)
+
+
+def _guess_delimiter(text: str) -> str:
+    """
+    Counts candidate delimiters in the first two lines; only if that is
+    ambiguous falls back to csv.Sniffer on a bounded chunk of the sample.
+    """
+    lines = text.split("\n", 2)
+    first = lines[0]
+    second = lines[1] if len(lines) > 1 else ""
+    found = [ch for ch in _CSV_DELIMITERS if first.count(ch) >= 1]
+    if len(found) == 1:
+        ch = found[0]
+        if not second.strip() or second.count(ch) == first.count(ch):
+            return ch
+    if not found:
+        # single-column file
+        return ","
+    try:
+        return csv.Sniffer().sniff(
+            text[:_CSV_SNIFF_MAX_CHARS], delimiters=_CSV_DELIMITERS
+        ).delimiter
+    except csv.Error:
+        return ","
+
+
+def _detect_csv_format(path: Path) -> CsvFormat:
+    """
+    Reads the first 64KB once and derives both encoding (BOM, then a UTF-8
+    trial decode, else detection on the same sample) and delimiter from it,
+    so the whole file is parsed exactly once instead of once per guessed encoding.
+    """
+    with path.open("rb") as f:
+        sample = f.read(_CSV_SAMPLE_SIZE)
+
+    if sample.startswith(b"\xef\xbb\xbf"):
+        encoding = "utf-8-sig"
+    elif sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+        encoding = "utf-16"
+    else:
+        try:
+            _decode_sample(sample, "utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = _guess_legacy_encoding(sample)
+
+    text = _decode_sample(sample, encoding, errors="replace")
+    if len(sample) == _CSV_SAMPLE_SIZE and "\n" in text:
+        # sniff whole lines only
+        text = text[: text.rindex("\n")]
+    delimiter = _guess_delimiter(text)
+    columns = tuple(next(csv.reader(text.splitlines()[:1], delimiter=delimiter), []))
+    return CsvFormat(encoding=encoding, delimiter=delimiter, columns=columns)
+
+
+def _load_csv_arrow(path: Path, fmt: CsvFormat) -> Optional[List[Dict[str, Any]]]:
+    """
+    Native (multi-threaded) CSV parser. Returns None if pyarrow is not installed.
+    """
+    pa_csv = _try_import_pyarrow_csv()
+    if pa_csv is None:
+        return None
+    import pyarrow as pa  # type: ignore
+
+    table = pa_csv.read_csv(
+        str(path),
+        read_options=pa_csv.ReadOptions(encoding=fmt.encoding),
+        parse_options=pa_csv.ParseOptions(delimiter=fmt.delimiter),
+        # values only end up as text in HTML: skip type inference, keep "001" as is
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in fmt.columns}
+        ),
+    )
+    return table.to_pylist()
+
+
 def _load_csv_records(path: Path) -> List[Dict[str, Any]]:
     """
-    Returns list of dict rows. Prefers pandas (if installed), otherwise csv.DictReader.
+    Returns list of dict rows. Small files go straight to csv.DictReader;
+    large ones prefer pyarrow, then pandas (C engine), then csv.DictReader.
+    pyarrow/pandas are imported only when actually needed.
     """
-    pd = _try_import_pandas()
-    if pd is not None:
-        df = pd.read_csv(path)
-        # pandas can produce NaN; normalize to None / str later during rendering
-        return df.to_dict(orient="records")
+    fmt = _detect_csv_format(path)
 
-    with path.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
+    if path.stat().st_size >= _CSV_NATIVE_MIN_SIZE:
+        try:
+            records = _load_csv_arrow(path, fmt)
+        except Exception:
+            # pyarrow is stricter (e.g. ragged rows); let the other readers try
+            records = None
+        if records is not None:
+            return records
+
+        pd = _try_import_pandas()
+        if pd is not None:
+            df = pd.read_csv(
+                path,
+                encoding=fmt.encoding,
+                sep=fmt.delimiter,
+                engine="c",
+                dtype=str,
+                # cells are plain text, as with pyarrow/csv.DictReader: keep
+                # "NA", "null", "None", "nan" ... as written
+                keep_default_na=False,
+            )
+            # only truly missing cells (short rows) can still be NaN: turn them
+            # into None once here, so id extraction and rendering only need
+            # an `is None` check (v != v is True only for NaN)
+            return [
+                {k: (None if v != v else v) for k, v in r.items()}
+                for r in df.to_dict(orient="records")
+            ]
+
+    with path.open("r", encoding=fmt.encoding, newline="") as f:
+        reader = csv.DictReader(f, delimiter=fmt.delimiter)
         return [dict(row) for row in reader]
 
 
+def _try_import_orjson():
+    try:
+        import orjson  # type: ignore
+
+        return orjson
+    except Exception:
+        return None
+
+
 def _load_json_records(path: Path) -> List[Dict[str, Any]]:
     """
     Supports:
@@ -123,8 +358,23 @@ def _load_json_records(path: Path) -> List[Dict[str, Any]]:
     - object with 'invoices' list: {"invoices": [{...}]}
     - dict keyed by id: {"INV-1": {...}, "INV-2": {...}}
     """
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    raw = path.read_bytes()
+    if raw.startswith(b"\xef\xbb\xbf"):
+        raw = raw[3:]
+
+    data: Any = None
+    orjson = _try_import_orjson()
+    if orjson is not None:
+        try:
+            # parses (and validates UTF-8) straight from bytes
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # e.g. NaN literals, which orjson rejects; json below handles them
+            # or reports the actual syntax error
+            data = None
+    if data is None:
+        # NaN/Infinity literals -> None, same as empty CSV cells
+        data = json.loads(raw, parse_constant=lambda _: None)
 
     if isinstance(data, list):
         return [x for x in data if isinstance(x, dict)]
@@ -158,36 +408,57 @@ def _load_records(path: Path) -> List[Dict[str, Any]]:
     raise ValueError(f"Неподдерживаемый тип данных: {ext}")
 
 
+# Lower-cased, in priority order; matched case-insensitively against record keys
+# (covers invoice_id / invoiceId / InvoiceID / "Invoice ID" / id / ID ...).
 INVOICE_ID_CANDIDATES = (
     "invoice_id",
-    "invoiceId",
+    "invoiceid",
     "invoice id",
     "invoice",
-    "InvoiceId",
-    "InvoiceID",
     "id",
-    "Id",
-    "ID",
 )
 
 
-def _extract_invoice_id(record: Dict[str, Any]) -> Optional[str]:
-    for k in INVOICE_ID_CANDIDATES:
-        if k in record and record[k] is not None:
-            val = record[k]
-            s = str(val).strip()
-            if s and s.lower() != "nan":
-                return s
+def _invoice_id_keys(record: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Actual record keys that may hold the invoice id, in candidate priority order.
+    """
+    # all keys per lower-cased name ("id", "Id", "ID" may coexist), in record order
+    lowered_keys: Dict[str, List[Any]] = {}
+    for k in record:
+        lowered_keys.setdefault(str(k).lower(), []).append(k)
+    return tuple(k for c in INVOICE_ID_CANDIDATES for k in lowered_keys.get(c, ()))
+
+
+def _extract_invoice_id(
+    record: Dict[str, Any], id_keys: Optional[Tuple[Any, ...]] = None
+) -> Optional[str]:
+    if id_keys is None:
+        id_keys = _invoice_id_keys(record)
+    for k in id_keys:
+        val = record.get(k)
+        if val is None:
+            continue
+        s = str(val).strip()
+        if s:
+            return s
     return None
 
 
 def _records_by_invoice_id(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     out: Dict[str, Dict[str, Any]] = {}
     auto_i = 1
+    # CSV rows (and most JSON dumps) share one key layout: resolve the id
+    # columns once per layout instead of case-folding every record's keys
+    id_keys_by_layout: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
     for r in records:
         if not isinstance(r, dict):
             continue
-        inv = _extract_invoice_id(r)
+        layout = tuple(r)
+        id_keys = id_keys_by_layout.get(layout)
+        if id_keys is None:
+            id_keys = id_keys_by_layout[layout] = _invoice_id_keys(r)
+        inv = _extract_invoice_id(r, id_keys)
         if not inv:
             inv = f"AUTO-{auto_i}"
             auto_i += 1
@@ -198,36 +469,133 @@ def _records_by_invoice_id(records: List[Dict[str, Any]]) -> Dict[str, Dict[str,
 
 _TPL_VAR_RE = re.compile(r"\{\{\s*([a-zA-Z0-9_.-]+)\s*\}\}")
 
+# Compiled template: literal HTML chunks interleaved with pre-split dotted keys.
+TemplateSegment = Union[str, Tuple[str, ...]]
+CompiledTemplate = Tuple[TemplateSegment, ...]
 
-def _get_nested(data: Dict[str, Any], dotted_key: str) -> Any:
+
+def _compile_template(template_html: str) -> CompiledTemplate:
+    """
+    Parses the template once into (literal, key) segments, so rendering
+    does not rescan the HTML with a regex for every invoice.
+    """
+    segments: List[TemplateSegment] = []
+    pos = 0
+    for m in _TPL_VAR_RE.finditer(template_html):
+        if m.start() > pos:
+            segments.append(template_html[pos : m.start()])
+        segments.append(tuple(m.group(1).split(".")))
+        pos = m.end()
+    if pos < len(template_html):
+        segments.append(template_html[pos:])
+    return tuple(segments)
+
+
+_BODY_OPEN_RE = re.compile(r"<body\b[^>]*>", re.IGNORECASE)
+_BODY_CLOSE_RE = re.compile(r"</body\s*>", re.IGNORECASE)
+
+PAGE_BREAK_HTML = '\n<div style="page-break-before: always"></div>\n'
+
+# (document start incl. <body>, body content, </body> and the rest)
+TemplateParts = Tuple[CompiledTemplate, CompiledTemplate, CompiledTemplate]
+
+
+def _split_template_body(template_html: str) -> Tuple[str, str, str]:
+    """
+    Splits a full HTML document around its <body> content, so several
+    invoices can share one <head>. Templates without <body> are treated
+    as a bare fragment.
+    """
+    m_open = _BODY_OPEN_RE.search(template_html)
+    if m_open is None:
+        return "", template_html, ""
+    close_matches = list(_BODY_CLOSE_RE.finditer(template_html, m_open.end()))
+    body_end = close_matches[-1].start() if close_matches else len(template_html)
+    return (
+        template_html[: m_open.end()],
+        template_html[m_open.end() : body_end],
+        template_html[body_end:],
+    )
+
+
+@lru_cache(maxsize=32)
+def _compile_template_file(path_str: str, mtime_ns: int, size: int) -> TemplateParts:
+    # mtime/size are part of the cache key: an edited template gets recompiled
+    text = Path(path_str).read_text(encoding="utf-8")
+    head, body, tail = _split_template_body(text)
+    return _compile_template(head), _compile_template(body), _compile_template(tail)
+
+
+def _load_compiled_template(path: Path) -> TemplateParts:
+    st = path.stat()
+    return _compile_template_file(str(path), st.st_mtime_ns, st.st_size)
+
+
+def _get_nested_fast(data: Dict[str, Any], parts: Tuple[str, ...]) -> Any:
+    # records are plain dicts (json / csv / pandas): exact type check is enough
     cur: Any = data
-    for part in dotted_key.split("."):
-        if isinstance(cur, dict) and part in cur:
-            cur = cur[part]
-        else:
+    for part in parts:
+        cur = cur.get(part) if type(cur) is dict else None
+        if cur is None:
             return None
     return cur
 
 
-def render_html_template(template_html: str, context: Dict[str, Any]) -> str:
+def _escape_val(val: Any) -> str:
+    if val is None:
+        return ""
+    return escape(str(val))
+
+
+def _render_into(
+    out: List[str], compiled: CompiledTemplate, context: Dict[str, Any]
+) -> None:
+    # appends to a shared list: callers join once, whatever the number of invoices
+    append = out.append
+    get = context.get
+    for seg in compiled:
+        if type(seg) is str:
+            append(seg)
+        elif len(seg) == 1:
+            # plain {{key}}: the common case, no nested walk
+            append(_escape_val(get(seg[0])))
+        else:
+            append(_escape_val(_get_nested_fast(context, seg)))
+
+
+def render_html_template(
+    template: Union[str, CompiledTemplate], context: Dict[str, Any]
+) -> str:
     """
     Minimal templating:
     - Replaces {{key}} with HTML-escaped value
     - Supports dotted keys: {{patient.name}}
+    - Accepts raw HTML or the result of _compile_template (reuse it for batches)
     """
+    compiled = _compile_template(template) if isinstance(template, str) else template
+    out: List[str] = []
+    _render_into(out, compiled, context)
+    return "".join(out)
 
-    def repl(m: re.Match) -> str:
-        key = m.group(1)
-        val = _get_nested(context, key)
-        if val is None:
-            return ""
-        # normalize NaN from pandas
-        s = str(val)
-        if s.lower() == "nan":
-            return ""
-        return escape(s)
 
-    return _TPL_VAR_RE.sub(repl, template_html)
+def render_batch_html(parts: TemplateParts, contexts: Sequence[Dict[str, Any]]) -> str:
+    """
+    Renders several invoices into one HTML document: the <head> is rendered
+    once (with the first context), bodies are separated by page breaks.
+    One document means one WeasyPrint call for the whole selection.
+    """
+    if not contexts:
+        raise ValueError("Список пуст")
+    head, body, tail = parts
+    first = contexts[0]
+    out: List[str] = []
+    _render_into(out, head, first)
+    for i, ctx in enumerate(contexts):
+        if i:
+            out.append(PAGE_BREAK_HTML)
+        _render_into(out, body, ctx)
+    _render_into(out, tail, first)
+    return "".join(out)
 
 
 def _find_font_file() -> Optional[Path]:
@@ -272,7 +640,19 @@ def _find_font_file() -> Optional[Path]:
     return None
 
 
+@lru_cache(maxsize=None)
+def _get_font_config() -> FontConfiguration:
+    # one instance per session: @font-face rules registered while parsing
+    # _build_css() must be visible to every write_pdf() call
+    return FontConfiguration()
+
+
+@lru_cache(maxsize=None)
 def _build_css(font_path: Optional[Path]) -> CSS:
+    """
+    Parsed once per font and reused for every PDF in the session:
+    stylesheet parsing is a noticeable part of a small document's render time.
+    """
     # WeasyPrint supports @font-face with file:// URLs
     font_face = ""
     font_family = "DejaVuSans"
@@ -300,15 +680,192 @@ html, body {{
   margin: 12mm;
 }}
 """
-    return CSS(string=base)
+    return CSS(string=base, font_config=_get_font_config())
+
+
+_UNSAFE_FILENAME_RE = re.compile(r"[^a-zA-Z0-9._-]+")
 
 
 def _safe_filename(s: str) -> str:
     # keep ASCII, digits, dash/underscore; replace others
-    out = re.sub(r"[^a-zA-Z0-9._-]+", "_", s.strip())
+    out = _UNSAFE_FILENAME_RE.sub("_", s.strip())
     return out or "invoice"
 
 
+def _try_import_pikepdf():
+    try:
+        import pikepdf  # type: ignore
+
+        return pikepdf
+    except Exception:
+        return None
+
+
+def _pdf_object_digest(pikepdf: Any, obj: Any, _stack: frozenset = frozenset()) -> str:
+    """
+    Content hash of a PDF object: every dictionary entry except a stream's
+    /Length, with indirect values (ICC profiles, palettes, soft masks...)
+    hashed by what they contain rather than by object number.
+    """
+    objgen = getattr(obj, "objgen", (0, 0))
+    if objgen != (0, 0):
+        if objgen in _stack:
+            return "cycle"
+        _stack = _stack | {objgen}
+
+    h = hashlib.sha1()
+    if isinstance(obj, pikepdf.Stream):
+        h.update(b"stream")
+        h.update(hashlib.sha1(obj.read_raw_bytes()).digest())
+        keys = [k for k in sorted(obj.keys()) if k != "/Length"]
+    elif isinstance(obj, pikepdf.Dictionary):
+        h.update(b"dict")
+        keys = sorted(obj.keys())
+    elif isinstance(obj, pikepdf.Array):
+        h.update(b"array")
+        for item in obj:
+            h.update(_pdf_object_digest(pikepdf, item, _stack).encode())
+        return h.hexdigest()
+    else:
+        h.update(repr(obj).encode())
+        return h.hexdigest()
+
+    for k in keys:
+        h.update(k.encode())
+        h.update(_pdf_object_digest(pikepdf, obj[k], _stack).encode())
+    return h.hexdigest()
+
+
+def _optimize_pdf(path: Path) -> bool:
+    """
+    Post-processes a written PDF with pikepdf:
+    - identical images (same bytes and image dictionary) are stored once and shared
+      between pages, e.g. a clinic logo repeated on every invoice of a batch;
+    - objects are packed into compressed object streams.
+    Returns False if pikepdf is not installed.
+    """
+    pikepdf = _try_import_pikepdf()
+    if pikepdf is None:
+        return False
+
+    with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+        first_by_digest: Dict[str, Any] = {}
+        for page in pdf.pages:
+            resources = page.obj.get("/Resources")
+            xobjects = resources.get("/XObject") if resources is not None else None
+            if xobjects is None:
+                continue
+            for name in list(xobjects.keys()):
+                xobj = xobjects[name]
+                if xobj.get("/Subtype") != "/Image":
+                    continue
+                first = first_by_digest.setdefault(_pdf_object_digest(pikepdf, xobj), xobj)
+                if first.objgen != xobj.objgen:
+                    # the duplicate becomes unreferenced and is not written on save
+                    xobjects[name] = first
+        pdf.save(
+            path,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            compress_streams=True,
+        )
+    return True
+
+
+# Every worker pays WeasyPrint import (re-import under spawn on Windows),
+# its own FontConfiguration/CSS and its own embedded font subsets; a chunk
+# must carry enough invoices to be worth that. Smaller batches stay in one call.
+_PARALLEL_MIN_CHUNK = 8
+
+
+def _render_pdf(
+    template_parts: TemplateParts,
+    contexts: Sequence[Dict[str, Any]],
+    font_path: Optional[Path],
+    base_url: str,
+    target: Optional[str] = None,
+) -> Optional[bytes]:
+    # all given invoices in a single WeasyPrint call; relative assets
+    # (<img src="logo.png">) resolve against base_url, the template's folder
+    html = render_batch_html(template_parts, contexts)
+    return HTML(string=html, base_url=base_url).write_pdf(
+        target, stylesheets=[_build_css(font_path)], font_config=_get_font_config()
+    )
+
+
+def _render_pdf_chunk(
+    tpl_path: str, contexts: List[Dict[str, Any]], font_path: Optional[str]
+) -> bytes:
+    """
+    Worker entry point (child process): takes only picklable arguments and
+    re-reads template/CSS itself, since WeasyPrint objects can't be pickled.
+    """
+    template_parts = _load_compiled_template(Path(tpl_path))
+    fp = Path(font_path) if font_path else None
+    base_url = str(Path(tpl_path).parent)
+    return _render_pdf(template_parts, contexts, fp, base_url)  # type: ignore[return-value]
+
+
+def _write_invoices_pdf(
+    out_path: Path,
+    tpl_path: Path,
+    contexts: List[Dict[str, Any]],
+    font_path: Optional[Path],
+) -> None:
+    """
+    Writes all invoices into out_path. Large batches are split into
+    contiguous chunks of at least _PARALLEL_MIN_CHUNK invoices (at most one
+    per CPU core), rendered in parallel processes and merged with pikepdf;
+    anything smaller (or no pikepdf) renders in this process in one call.
+    """
+    # absolute, so the folder works as base_url from any cwd / worker process
+    tpl_path = tpl_path.resolve()
+    workers = min(os.cpu_count() or 1, len(contexts) // _PARALLEL_MIN_CHUNK)
+    pikepdf = _try_import_pikepdf() if workers >= 2 else None
+    if pikepdf is None:
+        _render_pdf(
+            _load_compiled_template(tpl_path),
+            contexts,
+            font_path,
+            str(tpl_path.parent),
+            str(out_path),
+        )
+        return
+
+    chunk_size = -(-len(contexts) // workers)
+    chunks = [contexts[i : i + chunk_size] for i in range(0, len(contexts), chunk_size)]
+    font_arg = str(font_path) if font_path is not None else None
+    with ProcessPoolExecutor(max_workers=len(chunks)) as ex:
+        futures = [ex.submit(_render_pdf_chunk, str(tpl_path), c, font_arg) for c in chunks]
+        parts = [f.result() for f in futures]
+
+    merged = pikepdf.Pdf.new()
+    sources = [pikepdf.Pdf.open(io.BytesIO(data)) for data in parts]
+    try:
+        for src in sources:
+            merged.pages.extend(src.pages)
+        merged.save(out_path)
+    finally:
+        for src in sources:
+            src.close()
+        merged.close()
+
+
+def _reserve_unique_path(path: Path) -> Path:
+    """
+    Atomically creates an empty placeholder at path (or path_2, path_3, ...
+    if taken), so two runs in the same second never write the same file.
+    """
+    candidate = path
+    n = 1
+    while True:
+        try:
+            with candidate.open("xb"):
+                return candidate
+        except FileExistsError:
+            n += 1
+            candidate = path.with_name(f"{path.stem}_{n}{path.suffix}")
+
+
 def _open_file_in_system_viewer(path: Path) -> None:
     try:
         if sys.platform.startswith("win"):
@@ -323,47 +880,128 @@ def _open_file_in_system_viewer(path: Path) -> None:
         print(f"Не удалось автоматически открыть PDF: {e}")
 
 
-def main() -> int:
-    _configure_windows_utf8_console()
-    _ensure_dirs()
+def _parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Генерация PDF-чеков из CSV/JSON и HTML-шаблона"
+    )
+    parser.add_argument("--data", help="файл данных (CSV/JSON); имя ищется также в data/")
+    parser.add_argument("--template", help="HTML-шаблон; имя ищется также в templates/")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument(
+        "--invoice-ids",
+        help='какие чеки генерировать: invoice id через запятую ("INV-001,INV-002") или "all"',
+    )
+    selection.add_argument(
+        "--select",
+        help='какие чеки генерировать: номера в отсортированном списке id ("1,3,5-7")',
+    )
+    parser.add_argument("--out-dir", help=f"папка для PDF (по умолчанию {OUTPUT_DIR})")
+    parser.add_argument(
+        "--no-open",
+        action="store_true",
+        help="не открывать PDF после генерации (без меню не открывается всегда)",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="сжать PDF: убрать дубликаты изображений (нужен pikepdf)",
+    )
+    return parser.parse_args(argv)
 
+
+def _resolve_input_path(raw: str, default_dir: Path) -> Path:
+    p = Path(raw)
+    if not p.is_absolute() and not p.exists():
+        p = default_dir / raw
+    return p
+
+
+def _choose_input_files(
+    args: argparse.Namespace, output_dir: Path
+) -> Tuple[Optional[Path], Optional[Path]]:
+    """
+    Interactive part: lists data/ and templates/ and asks for whatever
+    was not given on the command line. (None, None) if there is nothing to pick.
+    """
     _print_header("Поиск данных и шаблонов")
-    data_files = _list_files_sorted(DATA_DIR, SUPPORTED_DATA_EXTS)
-    template_files = _list_files_sorted(TEMPLATES_DIR, {".html", ".htm"})
+    # only folders whose menu is actually shown are scanned and listed
+    data_files = [] if args.data else _list_files_sorted(DATA_DIR, SUPPORTED_DATA_EXTS)
+    template_files = (
+        [] if args.template else _list_files_sorted(TEMPLATES_DIR, {".html", ".htm"})
+    )
 
-    print(f"Директория данных:     {DATA_DIR}")
-    print(f"Директория шаблонов:   {TEMPLATES_DIR}")
-    print(f"Директория вывода PDF: {OUTPUT_DIR}")
+    if not args.data:
+        print(f"Директория данных:     {DATA_DIR}")
+    if not args.template:
+        print(f"Директория шаблонов:   {TEMPLATES_DIR}")
+    print(f"Директория вывода PDF: {output_dir}")
 
-    print("\nДоступные файлы данных:")
-    if not data_files:
-        print("  (нет файлов .csv/.json в папке data)")
-    else:
-        for i, p in enumerate(data_files, start=1):
-            print(f"  {i:>2}. {p.name}")
+    if not args.data:
+        print("\nДоступные файлы данных:")
+        if not data_files:
+            print("  (нет файлов .csv/.json в папке data)")
+        else:
+            for i, p in enumerate(data_files, start=1):
+                print(f"  {i:>2}. {p.name}")
 
-    print("\nДоступные HTML-шаблоны:")
-    if not template_files:
-        print("  (нет файлов .html/.htm в папке templates)")
+    if not args.template:
+        print("\nДоступные HTML-шаблоны:")
+        if not template_files:
+            print("  (нет файлов .html/.htm в папке templates)")
+        else:
+            for i, p in enumerate(template_files, start=1):
+                print(f"  {i:>2}. {p.name}")
+
+    missing: List[str] = []
+    if not args.data and not data_files:
+        missing.append("один файл данных в `data/`")
+    if not args.template and not template_files:
+        missing.append("один HTML-шаблон в `templates/`")
+    if missing:
+        print(f"\nДобавьте хотя бы {' и '.join(missing)}, затем запустите снова.")
+        return None, None
+
+    if args.data:
+        data_path = _resolve_input_path(args.data, DATA_DIR)
     else:
-        for i, p in enumerate(template_files, start=1):
-            print(f"  {i:>2}. {p.name}")
-
-    if not data_files or not template_files:
-        print(
-            "\nДобавьте хотя бы один файл данных в `data/` и один HTML-шаблон в `templates/`, затем запустите снова."
+        chosen_data = _choose_from_list(
+            "Выберите файл данных", [p.name for p in data_files]
         )
-        return 2
+        data_path = DATA_DIR / chosen_data
+    if args.template:
+        tpl_path = _resolve_input_path(args.template, TEMPLATES_DIR)
+    else:
+        chosen_tpl = _choose_from_list(
+            "Выберите HTML-шаблон", [p.name for p in template_files]
+        )
+        tpl_path = TEMPLATES_DIR / chosen_tpl
+    return data_path, tpl_path
 
-    chosen_data = _choose_from_list(
-        "Выберите файл данных", [p.name for p in data_files]
-    )
-    chosen_tpl = _choose_from_list(
-        "Выберите HTML-шаблон", [p.name for p in template_files]
-    )
 
-    data_path = DATA_DIR / chosen_data
-    tpl_path = TEMPLATES_DIR / chosen_tpl
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parse_args(argv)
+    _configure_windows_utf8_console()
+    _ensure_dirs()
+    output_dir = Path(args.out_dir) if args.out_dir else OUTPUT_DIR
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    non_interactive = bool(args.data and args.template)
+    if non_interactive:
+        # no listings, no menus, no input()
+        if not (args.invoice_ids or args.select):
+            print("Без меню нужно указать --invoice-ids (например: all) или --select.")
+            return 2
+        data_path = _resolve_input_path(args.data, DATA_DIR)
+        tpl_path = _resolve_input_path(args.template, TEMPLATES_DIR)
+    else:
+        data_path, tpl_path = _choose_input_files(args, output_dir)
+        if data_path is None or tpl_path is None:
+            return 2
+
+    for p in (data_path, tpl_path):
+        if not p.is_file():
+            print(f"Файл не найден: {p}")
+            return 2
 
     _print_header("Загрузка данных")
     print(f"Файл данных:   {data_path.name}")
@@ -378,22 +1016,35 @@ def main() -> int:
     by_id = _records_by_invoice_id(records)
     invoice_ids = sorted(by_id.keys(), key=lambda x: x.lower())
 
-    _print_header("Доступные чеки (invoice id)")
     if not invoice_ids:
         print("Не найдено ни одной записи.")
         return 4
 
-    chosen_id = _choose_from_list("Выберите invoice id", invoice_ids)
-    record = by_id[chosen_id]
+    if args.invoice_ids:
+        try:
+            chosen_ids = _select_invoice_ids(args.invoice_ids, invoice_ids)
+        except ValueError as e:
+            print(e)
+            return 2
+    elif args.select:
+        indices = _parse_selection(args.select, len(invoice_ids))
+        if not indices:
+            print(f"Неверный выбор --select (допустимо 1-{len(invoice_ids)}): {args.select}")
+            return 2
+        chosen_ids = [invoice_ids[i] for i in indices]
+    else:
+        _print_header("Доступные чеки (invoice id)")
+        chosen_ids = _choose_many_from_list("Выберите invoice id", invoice_ids)
 
     _print_header("Генерация PDF")
-    template_html = _read_text(tpl_path)
-    # enrich context with a couple of useful fields
-    context = dict(record)
-    context.setdefault("invoice_id", chosen_id)
-    context.setdefault("generated_at", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-
-    final_html = render_html_template(template_html, context)
+    generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    contexts: List[Dict[str, Any]] = []
+    for inv_id in chosen_ids:
+        # enrich context with a couple of useful fields
+        context = dict(by_id[inv_id])
+        context.setdefault("invoice_id", inv_id)
+        context.setdefault("generated_at", generated_at)
+        contexts.append(context)
 
     font_path = _find_font_file()
     if font_path is None:
@@ -404,20 +1055,39 @@ def main() -> int:
     else:
         print(f"Используем шрифт: {font_path}")
 
-    css = _build_css(font_path)
-    out_name = f"{_safe_filename(chosen_id)}.pdf"
-    out_path = OUTPUT_DIR / out_name
+    reserved = len(chosen_ids) > 1
+    if not reserved:
+        out_path = output_dir / f"{_safe_filename(chosen_ids[0])}.pdf"
+    else:
+        out_name = f"invoices_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        out_path = _reserve_unique_path(output_dir / out_name)
+        print(f"Чеков в одном PDF: {len(chosen_ids)}")
 
     try:
-        HTML(string=final_html, base_url=str(TEMPLATES_DIR)).write_pdf(
-            str(out_path), stylesheets=[css]
-        )
+        _write_invoices_pdf(out_path, tpl_path, contexts, font_path)
     except Exception as e:
         print(f"Ошибка генерации PDF (WeasyPrint): {e}")
+        if reserved:
+            # don't leave the empty placeholder behind
+            out_path.unlink(missing_ok=True)
         return 5
 
+    if args.optimize:
+        size_before = out_path.stat().st_size
+        try:
+            optimized = _optimize_pdf(out_path)
+        except Exception as e:
+            print(f"Не удалось оптимизировать PDF: {e}")
+        else:
+            if optimized:
+                size_after = out_path.stat().st_size
+                print(f"PDF оптимизирован: {size_before // 1024} КБ -> {size_after // 1024} КБ")
+            else:
+                print("Оптимизация пропущена: установите pikepdf (python -m pip install pikepdf).")
+
     print(f"PDF сохранен: {out_path}")
-    _open_file_in_system_viewer(out_path)
+    if not (non_interactive or args.no_open):
+        _open_file_in_system_viewer(out_path)
     return 0
 
 